@@ -5,30 +5,201 @@ An Application Profile contains all the information about an application in
 Mackup. Name, files, ...
 """
 
+import collections
 import os
+import stat
 
+from .constants import STAT_THREADS, STAT_THREADS_MIN_FILES
 from .mackup import Mackup
 from . import utils
 
 
+# What a single stat tells us about a path. The file type fields follow
+# symlinks, like os.path.isfile() and friends, while is_symlink does not.
+_Probe = collections.namedtuple(
+    "_Probe", ["exists", "is_file", "is_dir", "is_symlink", "st_ino", "st_dev"]
+)
+
+_MISSING = _Probe(False, False, False, False, None, None)
+
+
+# What to do with a file of an application, and why. kind is "noop",
+# "backup", "restore" or "revert". home and mackup are the probes the
+# decision was based on.
+_Action = collections.namedtuple(
+    "_Action",
+    [
+        "kind",
+        "filename",
+        "home_filepath",
+        "mackup_filepath",
+        "home",
+        "mackup",
+        "reason",
+    ],
+)
+
+# How actions are shown to the user when not in verbose mode
+_VERBS = {"backup": "Backing up", "restore": "Restoring", "revert": "Reverting"}
+
+
+def _probe(path):
+    """
+    Stat the given path once and describe what lives there.
+
+    A second stat is only issued when the path is a symlink, to learn about
+    its target.
+
+    Args:
+        path (str)
+
+    Returns:
+        _Probe
+    """
+    try:
+        st = os.lstat(path)
+    except (OSError, ValueError):
+        return _MISSING
+
+    is_symlink = stat.S_ISLNK(st.st_mode)
+    if is_symlink:
+        try:
+            st = os.stat(path)
+        except (OSError, ValueError):
+            # Broken link
+            return _Probe(False, False, False, True, None, None)
+
+    return _Probe(
+        True,
+        stat.S_ISREG(st.st_mode),
+        stat.S_ISDIR(st.st_mode),
+        is_symlink,
+        st.st_ino,
+        st.st_dev,
+    )
+
+
+def _samefile(probe1, probe2):
+    """
+    Check if two probes point to the same file, like os.path.samefile().
+
+    Args:
+        probe1 (_Probe)
+        probe2 (_Probe)
+
+    Returns:
+        bool
+    """
+    return (
+        probe1.exists
+        and probe2.exists
+        and (probe1.st_ino, probe1.st_dev) == (probe2.st_ino, probe2.st_dev)
+    )
+
+
+def _classify(probe):
+    """
+    Name the type of the probed file, the way we show it to the user.
+
+    Args:
+        probe (_Probe)
+
+    Returns:
+        str: "file", "folder" or "link", or None if unsupported
+    """
+    if probe.is_file:
+        return "file"
+    if probe.is_dir:
+        return "folder"
+    if probe.is_symlink:
+        return "link"
+    return None
+
+
+def _prefetch(path):
+    """
+    Ask the kernel to start reading the given file in its page cache.
+
+    Only a hint, where posix_fadvise() is available (not on macOS).
+
+    Args:
+        path (str)
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _overlap(filename1, filename2):
+    """
+    Check if one of the given files is the other one or lives below it.
+
+    Args:
+        filename1 (str)
+        filename2 (str)
+
+    Returns:
+        bool
+    """
+    return (
+        filename1 == filename2
+        or filename1.startswith(filename2 + "/")
+        or filename2.startswith(filename1 + "/")
+    )
+
+
 class ApplicationProfile(object):
     """Instantiate this class with application specific data."""
 
-    def __init__(self, mackup, files, dry_run, verbose):
+    def __init__(self, mackup, files, dry_run, verbose, stat_threads=STAT_THREADS):
         """
         Create an ApplicationProfile instance.
 
         Args:
             mackup (Mackup)
-            files (list)
+            files (set)
+            dry_run (bool)
+            verbose (bool)
+            stat_threads (int): Number of threads used to inspect the files
         """
         assert isinstance(mackup, Mackup)
         assert isinstance(files, set)
 
         self.mackup = mackup
-        self.files = list(files)
+        # Shallow files first, then by name, so that runs are reproducible and
+        # parents are handled before what they contain
+        self.files = tuple(sorted(files, key=lambda f: (f.count("/"), len(f), f)))
         self.dry_run = dry_run
         self.verbose = verbose
+        self.stat_threads = stat_threads
+
+        # Resolved once, as getFilepaths() is called for every file
+        self._home = os.environ["HOME"]
+        self._mackup_folder = self.mackup.mackup_folder
+        # Device of the Mackup folder, only looked up when needed
+        self._mackup_folder_dev = None
+
+    def _get_mackup_folder_dev(self):
+        """
+        Get the device of the Mackup folder, stating it only once.
+
+        Returns:
+            int
+        """
+        if self._mackup_folder_dev is None:
+            self._mackup_folder_dev = os.stat(self._mackup_folder).st_dev
+
+        return self._mackup_folder_dev
 
     def getFilepaths(self, filename):
         """
@@ -41,8 +212,28 @@ class ApplicationProfile(object):
             home_filepath, mackup_filepath (str, str)
         """
         return (
-            os.path.join(os.environ["HOME"], filename),
-            os.path.join(self.mackup.mackup_folder, filename),
+            os.path.join(self._home, filename),
+            os.path.join(self._mackup_folder, filename),
+        )
+
+    def inspect(self, filename):
+        """
+        Get home and mackup filepaths for given file, and probe them.
+
+        Args:
+            filename (str)
+
+        Returns:
+            home_filepath, mackup_filepath, home, mackup
+            (str, str, _Probe, _Probe)
+        """
+        (home_filepath, mackup_filepath) = self.getFilepaths(filename)
+
+        return (
+            home_filepath,
+            mackup_filepath,
+            _probe(home_filepath),
+            _probe(mackup_filepath),
         )
 
     def backup(self):
@@ -62,78 +253,7 @@ class ApplicationProfile(object):
                   mv home/file mackup/file
                   link mackup/file home/file
         """
-        # For each file used by the application
-        for filename in self.files:
-            (home_filepath, mackup_filepath) = self.getFilepaths(filename)
-
-            # If the file exists and is not already a link pointing to Mackup
-            if (os.path.isfile(home_filepath) or os.path.isdir(home_filepath)) and not (
-                os.path.islink(home_filepath)
-                and (os.path.isfile(mackup_filepath) or os.path.isdir(mackup_filepath))
-                and os.path.samefile(home_filepath, mackup_filepath)
-            ):
-                if self.verbose:
-                    print(
-                        "Backing up\n  {}\n  to\n  {} ...".format(
-                            home_filepath, mackup_filepath
-                        )
-                    )
-                else:
-                    print("Backing up {} ...".format(filename))
-
-                if self.dry_run:
-                    continue
-
-                # Check if we already have a backup
-                if os.path.exists(mackup_filepath):
-                    # Name it right
-                    if os.path.isfile(mackup_filepath):
-                        file_type = "file"
-                    elif os.path.isdir(mackup_filepath):
-                        file_type = "folder"
-                    elif os.path.islink(mackup_filepath):
-                        file_type = "link"
-                    else:
-                        raise ValueError("Unsupported file: {}".format(mackup_filepath))
-
-                    # Ask the user if he really wants to replace it
-                    if utils.confirm(
-                        "A {} named {} already exists in the"
-                        " backup.\nAre you sure that you want to"
-                        " replace it?".format(file_type, mackup_filepath)
-                    ):
-                        # Delete the file in Mackup
-                        utils.delete(mackup_filepath)
-                        # Copy the file
-                        utils.copy(home_filepath, mackup_filepath)
-                        # Delete the file in the home
-                        utils.delete(home_filepath)
-                        # Link the backuped file to its original place
-                        utils.link(mackup_filepath, home_filepath)
-                else:
-                    # Copy the file
-                    utils.copy(home_filepath, mackup_filepath)
-                    # Delete the file in the home
-                    utils.delete(home_filepath)
-                    # Link the backuped file to its original place
-                    utils.link(mackup_filepath, home_filepath)
-            elif self.verbose:
-                if os.path.exists(home_filepath):
-                    print(
-                        "Doing nothing\n  {}\n  "
-                        "is already backed up to\n  {}".format(
-                            home_filepath, mackup_filepath
-                        )
-                    )
-                elif os.path.islink(home_filepath):
-                    print(
-                        "Doing nothing\n  {}\n  "
-                        "is a broken link, you might want to fix it.".format(
-                            home_filepath
-                        )
-                    )
-                else:
-                    print("Doing nothing\n  {}\n  does not exist".format(home_filepath))
+        self._run(self._decide_backup)
 
     def restore(self):
         """
@@ -149,75 +269,7 @@ class ApplicationProfile(object):
               else
                 link mackup/file home/file
         """
-        # For each file used by the application
-        for filename in self.files:
-            (home_filepath, mackup_filepath) = self.getFilepaths(filename)
-
-            # If the file exists and is not already pointing to the mackup file
-            # and the folder makes sense on the current platform (Don't sync
-            # any subfolder of ~/Library on GNU/Linux)
-            file_or_dir_exists = os.path.isfile(mackup_filepath) or os.path.isdir(
-                mackup_filepath
-            )
-            pointing_to_mackup = (
-                os.path.islink(home_filepath)
-                and os.path.exists(mackup_filepath)
-                and os.path.samefile(mackup_filepath, home_filepath)
-            )
-            supported = utils.can_file_be_synced_on_current_platform(filename)
-
-            if file_or_dir_exists and not pointing_to_mackup and supported:
-                if self.verbose:
-                    print(
-                        "Restoring\n  linking {}\n  to      {} ...".format(
-                            home_filepath, mackup_filepath
-                        )
-                    )
-                else:
-                    print("Restoring {} ...".format(filename))
-
-                if self.dry_run:
-                    continue
-
-                # Check if there is already a file in the home folder
-                if os.path.exists(home_filepath):
-                    # Name it right
-                    if os.path.isfile(home_filepath):
-                        file_type = "file"
-                    elif os.path.isdir(home_filepath):
-                        file_type = "folder"
-                    elif os.path.islink(home_filepath):
-                        file_type = "link"
-                    else:
-                        raise ValueError("Unsupported file: {}".format(mackup_filepath))
-
-                    if utils.confirm(
-                        "You already have a {} named {} in your"
-                        " home.\nDo you want to replace it with"
-                        " your backup?".format(file_type, filename)
-                    ):
-                        utils.delete(home_filepath)
-                        utils.link(mackup_filepath, home_filepath)
-                else:
-                    utils.link(mackup_filepath, home_filepath)
-            elif self.verbose:
-                if os.path.exists(home_filepath):
-                    print(
-                        "Doing nothing\n  {}\n  already linked by\n  {}".format(
-                            mackup_filepath, home_filepath
-                        )
-                    )
-                elif os.path.islink(home_filepath):
-                    print(
-                        "Doing nothing\n  {}\n  "
-                        "is a broken link, you might want to fix it.".format(
-                            home_filepath
-                        )
-                    )
-                else:
-                    print(
-                        "Doing nothing\n  {}\n  does not exist".format(mackup_filepath)
-                    )
+        self._run(self._decide_restore)
 
     def uninstall(self):
         """
@@ -234,31 +286,266 @@ class ApplicationProfile(object):
             delete the mackup folder
             print how to delete mackup
         """
-        # For each file used by the application
-        for filename in self.files:
+        self._run(self._decide_uninstall)
+
+    def _run(self, decide):
+        """
+        Decide what to do with each file, then show it and do it.
+
+        In dry run mode, the actions are only shown.
+
+        Args:
+            decide (callable): Returns the _Action for a given filename
+        """
+        modified = []
+
+        for action in self._plan(decide):
+            # Decisions taken before we modified a file above or below this
+            # one are outdated
+            if any(_overlap(action.filename, other) for other in modified):
+                action = decide(action.filename)
+
+            self._report(action)
+
+            if self.dry_run or action.kind == "noop":
+                continue
+
+            if self._apply(action):
+                modified.append(action.filename)
+
+    def _plan(self, decide):
+        """
+        Decide what to do with every file used by the application.
+
+        When more than one stat thread is allowed, applications with enough
+        files are inspected in parallel, for file systems with a high latency.
+        Otherwise a thread pool costs more than it saves. Acting on the files
+        stays sequential, as it might ask the user for confirmation.
+
+        Args:
+            decide (callable): Returns the _Action for a given filename
+
+        Returns:
+            list of _Action, in the same order as the files
+        """
+        max_workers = min(self.stat_threads, len(self.files))
+        if max_workers <= 1 or len(self.files) < STAT_THREADS_MIN_FILES:
+            return [decide(filename) for filename in self.files]
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(decide, self.files))
+
+    def _decide_backup(self, filename):
+        """
+        Decide how to back up the given file.
+
+        Args:
+            filename (str)
+
+        Returns:
+            _Action
+        """
+        (home_filepath, mackup_filepath, home, mackup) = self.inspect(filename)
+
+        # If the file exists and is not already a link pointing to Mackup
+        if (home.is_file or home.is_dir) and not (
+            home.is_symlink
+            and (mackup.is_file or mackup.is_dir)
+            and _samefile(home, mackup)
+        ):
+            kind = "backup"
+            reason = "Backing up\n  {}\n  to\n  {} ...".format(
+                home_filepath, mackup_filepath
+            )
+        else:
+            kind = "noop"
+            if home.exists:
+                reason = (
+                    "Doing nothing\n  {}\n  "
+                    "is already backed up to\n  {}".format(
+                        home_filepath, mackup_filepath
+                    )
+                )
+            elif home.is_symlink:
+                reason = (
+                    "Doing nothing\n  {}\n  "
+                    "is a broken link, you might want to fix it.".format(home_filepath)
+                )
+            else:
+                reason = "Doing nothing\n  {}\n  does not exist".format(home_filepath)
+
+        return _Action(
+            kind, filename, home_filepath, mackup_filepath, home, mackup, reason
+        )
+
+    def _decide_restore(self, filename):
+        """
+        Decide how to restore the given file.
+
+        Args:
+            filename (str)
+
+        Returns:
+            _Action
+        """
+        # Don't even look at the files that make no sense on the current
+        # platform (Don't sync any subfolder of ~/Library on GNU/Linux)
+        if not utils.can_file_be_synced_on_current_platform(filename):
             (home_filepath, mackup_filepath) = self.getFilepaths(filename)
+            reason = "Doing nothing\n  {}\n  can't be synced on this platform".format(
+                home_filepath
+            )
+            return _Action(
+                "noop", filename, home_filepath, mackup_filepath, None, None, reason
+            )
+
+        (home_filepath, mackup_filepath, home, mackup) = self.inspect(filename)
+
+        # If the file exists and is not already pointing to the mackup file
+        file_or_dir_exists = mackup.is_file or mackup.is_dir
+        pointing_to_mackup = home.is_symlink and _samefile(mackup, home)
+
+        if file_or_dir_exists and not pointing_to_mackup:
+            kind = "restore"
+            reason = "Restoring\n  linking {}\n  to      {} ...".format(
+                home_filepath, mackup_filepath
+            )
+        else:
+            kind = "noop"
+            if home.exists:
+                reason = "Doing nothing\n  {}\n  already linked by\n  {}".format(
+                    mackup_filepath, home_filepath
+                )
+            elif home.is_symlink:
+                reason = (
+                    "Doing nothing\n  {}\n  "
+                    "is a broken link, you might want to fix it.".format(home_filepath)
+                )
+            else:
+                reason = "Doing nothing\n  {}\n  does not exist".format(mackup_filepath)
+
+        return _Action(
+            kind, filename, home_filepath, mackup_filepath, home, mackup, reason
+        )
+
+    def _decide_uninstall(self, filename):
+        """
+        Decide how to put the given file back in place.
+
+        Args:
+            filename (str)
+
+        Returns:
+            _Action
+        """
+        (home_filepath, mackup_filepath, home, mackup) = self.inspect(filename)
+
+        # If the mackup file exists
+        if mackup.is_file or mackup.is_dir:
+            # Check if there is a corresponding file in the home folder
+            if home.exists:
+                kind = "revert"
+                reason = "Reverting {}\n  at {} ...".format(
+                    mackup_filepath, home_filepath
+                )
+            else:
+                kind = "noop"
+                reason = None
+        else:
+            kind = "noop"
+            reason = "Doing nothing, {} does not exist".format(mackup_filepath)
+
+        return _Action(
+            kind, filename, home_filepath, mackup_filepath, home, mackup, reason
+        )
+
+    def _report(self, action):
+        """
+        Tell the user what is going to happen to a file.
+
+        Args:
+            action (_Action)
+        """
+        if action.kind == "noop":
+            if self.verbose and action.reason:
+                print(action.reason)
+        elif self.verbose:
+            print(action.reason)
+        else:
+            print("{} {} ...".format(_VERBS[action.kind], action.filename))
+
+    def _apply(self, action):
+        """
+        Carry out the given action.
+
+        Args:
+            action (_Action)
+
+        Returns:
+            bool: True if files have been modified
+        """
+        home_filepath = action.home_filepath
+        mackup_filepath = action.mackup_filepath
+
+        if action.kind == "backup":
+            # If it has to be copied rather than moved, have it read while the
+            # user answers
+            if action.home.is_file and (
+                action.home.is_symlink
+                or action.home.st_dev != self._get_mackup_folder_dev()
+            ):
+                _prefetch(home_filepath)
+
+            # Check if we already have a backup
+            if action.mackup.exists:
+                # Name it right
+                file_type = _classify(action.mackup)
+                if file_type is None:
+                    raise ValueError("Unsupported file: {}".format(mackup_filepath))
+
+                # Ask the user if he really wants to replace it
+                if not utils.confirm(
+                    "A {} named {} already exists in the"
+                    " backup.\nAre you sure that you want to"
+                    " replace it?".format(file_type, mackup_filepath)
+                ):
+                    return False
+
+                # Delete the file in Mackup
+                utils.delete(mackup_filepath)
+
+            # Move the file to Mackup
+            utils.move(home_filepath, mackup_filepath)
+            # Link the backuped file to its original place
+            utils.link(mackup_filepath, home_filepath)
+
+        elif action.kind == "restore":
+            # Check if there is already a file in the home folder
+            if action.home.exists:
+                # Name it right
+                file_type = _classify(action.home)
+                if file_type is None:
+                    raise ValueError("Unsupported file: {}".format(home_filepath))
+
+                if not utils.confirm(
+                    "You already have a {} named {} in your"
+                    " home.\nDo you want to replace it with"
+                    " your backup?".format(file_type, action.filename)
+                ):
+                    return False
+
+                utils.delete(home_filepath)
+
+            utils.link(mackup_filepath, home_filepath)
+
+        elif action.kind == "revert":
+            # Delete the file in the home, as we are gonna copy the Dropbox one
+            # there
+            utils.delete(home_filepath)
+
+            # Copy the Dropbox file to the home folder
+            utils.copy(mackup_filepath, home_filepath)
 
-            # If the mackup file exists
-            if os.path.isfile(mackup_filepath) or os.path.isdir(mackup_filepath):
-                # Check if there is a corresponding file in the home folder
-                if os.path.exists(home_filepath):
-                    if self.verbose:
-                        print(
-                            "Reverting {}\n  at {} ...".format(
-                                mackup_filepath, home_filepath
-                            )
-                        )
-                    else:
-                        print("Reverting {} ...".format(filename))
-
-                    if self.dry_run:
-                        continue
-
-                    # If there is, delete it as we are gonna copy the Dropbox
-                    # one there
-                    utils.delete(home_filepath)
-
-                    # Copy the Dropbox file to the home folder
-                    utils.copy(mackup_filepath, home_filepath)
-            elif self.verbose:
-                print("Doing nothing, {} does not exist".format(mackup_filepath))
+        return True
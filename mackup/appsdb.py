@@ -5,16 +5,31 @@ The Applications Database provides an easy to use interface to load application
 data from the Mackup Database (files).
 """
 
+import json
 import os
-
-try:
-    import configparser
-except ImportError:
-    import ConfigParser as configparser
-
+import tempfile
+from configparser import ConfigParser
 
 from .constants import APPS_DIR
 from .constants import CUSTOM_APPS_DIR
+from .constants import VERSION
+
+
+def _read_config_file(config_file):
+    """
+    Read the content of an application config file.
+
+    Args:
+        config_file (str)
+
+    Returns:
+        str, or None if the file can't be read
+    """
+    try:
+        with open(config_file, "rb") as f:
+            return f.read().decode()
+    except (OSError, UnicodeDecodeError):
+        return None
 
 
 class ApplicationsDatabase(object):
@@ -22,57 +37,87 @@ class ApplicationsDatabase(object):
 
     def __init__(self):
         """Create a ApplicationsDatabase instance."""
-        # Build the dict that will contain the properties of each application
-        self.apps = dict()
+        config_files = ApplicationsDatabase.get_config_files()
+
+        # Config files rarely change, so reuse the previous run's work if we
+        # can
+        fingerprint = ApplicationsDatabase.get_fingerprint(config_files)
+        self.apps = ApplicationsDatabase.load_cache(fingerprint)
 
-        for config_file in ApplicationsDatabase.get_config_files():
-            config = configparser.ConfigParser(allow_no_value=True)
+        if self.apps is None:
+            self.apps = ApplicationsDatabase.parse_config_files(config_files)
+            ApplicationsDatabase.save_cache(fingerprint, self.apps)
+
+    @staticmethod
+    def parse_config_files(config_files):
+        """
+        Parse the given application configuration files.
+
+        Args:
+            config_files (set of str)
+
+        Returns:
+            dict of app_name: {"name": str, "configuration_files": set}
+        """
+        # Build the dict that will contain the properties of each application
+        apps = dict()
+
+        # XDG configuration files are synced relative to the home
+        home = os.path.expanduser("~/")
+        failobj = "{}.config".format(home)
+        xdg_config_home = os.environ.get("XDG_CONFIG_HOME", failobj)
+        if not xdg_config_home.startswith(home):
+            raise ValueError(
+                "$XDG_CONFIG_HOME: {} must be "
+                "somewhere within your home "
+                "directory: {}".format(xdg_config_home, home)
+            )
+        xdg_config_home_rel = xdg_config_home[len(home) :]
+
+        for config_file in config_files:
+            config = ConfigParser(allow_no_value=True)
 
             # Needed to not lowercase the configuration_files in the ini files
             config.optionxform = str
 
-            if config.read(config_file):
+            content = _read_config_file(config_file)
+            if content is not None:
+                config.read_string(content, source=config_file)
+
                 # Get the filename without the directory name
                 filename = os.path.basename(config_file)
                 # The app name is the cfg filename with the extension
                 app_name = filename[: -len(".cfg")]
 
                 # Start building a dict for this app
-                self.apps[app_name] = dict()
+                apps[app_name] = dict()
 
                 # Add the fancy name for the app, for display purpose
                 app_pretty_name = config.get("application", "name")
-                self.apps[app_name]["name"] = app_pretty_name
+                apps[app_name]["name"] = app_pretty_name
 
                 # Add the configuration files to sync
-                self.apps[app_name]["configuration_files"] = set()
+                apps[app_name]["configuration_files"] = set()
                 if config.has_section("configuration_files"):
                     for path in config.options("configuration_files"):
                         if path.startswith("/"):
                             raise ValueError(
                                 "Unsupported absolute path: {}".format(path)
                             )
-                        self.apps[app_name]["configuration_files"].add(path)
+                        apps[app_name]["configuration_files"].add(path)
 
                 # Add the XDG configuration files to sync
-                home = os.path.expanduser("~/")
-                failobj = "{}.config".format(home)
-                xdg_config_home = os.environ.get("XDG_CONFIG_HOME", failobj)
-                if not xdg_config_home.startswith(home):
-                    raise ValueError(
-                        "$XDG_CONFIG_HOME: {} must be "
-                        "somewhere within your home "
-                        "directory: {}".format(xdg_config_home, home)
-                    )
                 if config.has_section("xdg_configuration_files"):
                     for path in config.options("xdg_configuration_files"):
                         if path.startswith("/"):
                             raise ValueError(
                                 "Unsupported absolute path: " "{}".format(path)
                             )
-                        path = os.path.join(xdg_config_home, path)
-                        path = path.replace(home, "")
-                        (self.apps[app_name]["configuration_files"].add(path))
+                        apps[app_name]["configuration_files"].add(
+                            os.path.join(xdg_config_home_rel, path)
+                        )
+
+        return apps
 
     @staticmethod
     def get_config_files():
@@ -101,21 +146,147 @@ class ApplicationsDatabase(object):
 
         # Get the list of custom application config files first
         if os.path.isdir(custom_apps_dir):
-            for filename in os.listdir(custom_apps_dir):
-                if filename.endswith(".cfg"):
-                    config_files.add(os.path.join(custom_apps_dir, filename))
-                    # Also add it to the set of custom apps, so that we don't
-                    # add the stock config for the same app too
-                    custom_files.add(filename)
+            with os.scandir(custom_apps_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".cfg"):
+                        config_files.add(entry.path)
+                        # Also add it to the set of custom apps, so that we
+                        # don't add the stock config for the same app too
+                        custom_files.add(entry.name)
 
         # Add the default provided app config files, but only if those are not
         # customized, as we don't want to overwrite custom app config.
-        for filename in os.listdir(apps_dir):
-            if filename.endswith(".cfg") and filename not in custom_files:
-                config_files.add(os.path.join(apps_dir, filename))
+        with os.scandir(apps_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".cfg") and entry.name not in custom_files:
+                    config_files.add(entry.path)
 
         return config_files
 
+    @staticmethod
+    def get_cache_file():
+        """
+        Return the path to the file caching the parsed database.
+
+        As per the XDG spec, $XDG_CACHE_HOME is ignored unless it is an
+        absolute path.
+
+        Returns:
+            str
+        """
+        cache_home = os.environ.get("XDG_CACHE_HOME", "")
+        if not os.path.isabs(cache_home):
+            cache_home = os.path.join(os.environ["HOME"], ".cache")
+
+        return os.path.join(cache_home, "mackup", "appsdb.json")
+
+    @staticmethod
+    def get_fingerprint(config_files):
+        """
+        Return what the parsed database depends on.
+
+        That's the version of Mackup, the home and XDG config folders, and the
+        path, modification time and size of every config file.
+
+        It is made of lists, so that it reads back from JSON as it was.
+
+        Args:
+            config_files (set of str)
+
+        Returns:
+            list
+        """
+        stats = []
+        for config_file in sorted(config_files):
+            try:
+                st = os.stat(config_file)
+            except OSError:
+                stats.append([config_file, None, None])
+            else:
+                stats.append([config_file, st.st_mtime_ns, st.st_size])
+
+        return [
+            VERSION,
+            os.path.expanduser("~/"),
+            os.environ.get("XDG_CONFIG_HOME"),
+            stats,
+        ]
+
+    @staticmethod
+    def load_cache(fingerprint):
+        """
+        Load the cached database, if it was built from the same files.
+
+        The cache is plain JSON, never pickled: it lives in a folder the user
+        can write to, and Mackup may be run as root.
+
+        Args:
+            fingerprint (list)
+
+        Returns:
+            dict, or None if there is no usable cache
+        """
+        try:
+            with open(ApplicationsDatabase.get_cache_file(), "rb") as f:
+                cache = json.loads(f.read().decode())
+
+            if cache["fingerprint"] != fingerprint:
+                return None
+
+            return {
+                app_name: {
+                    "name": app["name"],
+                    "configuration_files": set(app["configuration_files"]),
+                }
+                for app_name, app in cache["apps"].items()
+            }
+        except Exception:
+            # A missing, unreadable or corrupted cache is just a cache miss
+            return None
+
+    @staticmethod
+    def save_cache(fingerprint, apps):
+        """
+        Cache the database for the next runs.
+
+        The file is replaced atomically. Failing to write it is not an error.
+
+        Nothing is written when running as root: the cache is in the user's
+        home, which sudo may keep, and root owned files there would break the
+        user's next runs.
+
+        Args:
+            fingerprint (list)
+            apps (dict)
+        """
+        if os.geteuid() == 0:
+            return
+
+        cache = {
+            "fingerprint": fingerprint,
+            "apps": {
+                app_name: {
+                    "name": app["name"],
+                    "configuration_files": sorted(app["configuration_files"]),
+                }
+                for app_name, app in apps.items()
+            },
+        }
+
+        cache_file = ApplicationsDatabase.get_cache_file()
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file))
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(cache, f)
+                os.replace(tmp_file, cache_file)
+            except BaseException:
+                os.remove(tmp_file)
+                raise
+        except OSError:
+            pass
+
     def get_name(self, name):
         """
         Return the fancy name of an application.
@@ -150,11 +321,7 @@ class ApplicationsDatabase(object):
         Returns:
             set of str.
         """
-        app_names = set()
-        for name in self.apps:
-            app_names.add(name)
-
-        return app_names
+        return set(self.apps)
 
     def get_pretty_app_names(self):
         """
@@ -163,8 +330,4 @@ class ApplicationsDatabase(object):
         Returns:
             set of str.
         """
-        pretty_app_names = set()
-        for app_name in self.get_app_names():
-            pretty_app_names.add(self.get_name(app_name))
-
-        return pretty_app_names
+        return {app["name"] for app in self.apps.values()}
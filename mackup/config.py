@@ -2,6 +2,8 @@
 
 import os
 import os.path
+import sys
+from configparser import ConfigParser
 
 from .constants import (
     CUSTOM_APPS_DIR,
@@ -20,15 +22,24 @@ from .utils import (
     get_icloud_folder_location,
 )
 
-try:
-    import configparser
-except ImportError:
-    import ConfigParser as configparser
+# Parsed config files, by full path:
+# {path: ((inode, device, mtime, size), parser)}
+_PARSER_CACHE = {}
 
 
 class Config(object):
     """The Mackup Config class."""
 
+    __slots__ = (
+        "_parser",
+        "_engine",
+        "_path",
+        "_directory",
+        "_fullpath",
+        "_apps_to_ignore",
+        "_apps_to_sync",
+    )
+
     def __init__(self, filename=None):
         """
         Create a Config instance.
@@ -37,8 +48,6 @@ class Config(object):
             filename (str): Optional filename of the config file. If empty,
                             defaults to MACKUP_CONFIG_FILE
         """
-        assert isinstance(filename, str) or filename is None
-
         # Initialize the parser
         self._parser = self._setup_parser(filename)
 
@@ -54,12 +63,18 @@ class Config(object):
         # Get the directory replacing 'Mackup', if any
         self._directory = self._parse_directory()
 
+        # Get the full path to the Mackup folder
+        self._fullpath = os.path.join(self._path, self._directory)
+
         # Get the list of apps to ignore
         self._apps_to_ignore = self._parse_apps_to_ignore()
 
         # Get the list of apps to allow
         self._apps_to_sync = self._parse_apps_to_sync()
 
+        # Everything we need has been extracted
+        del self._parser
+
     @property
     def engine(self):
         """
@@ -70,7 +85,7 @@ class Config(object):
         Returns:
             str
         """
-        return str(self._engine)
+        return self._engine
 
     @property
     def path(self):
@@ -83,7 +98,7 @@ class Config(object):
         Returns:
             str
         """
-        return str(self._path)
+        return self._path
 
     @property
     def directory(self):
@@ -93,7 +108,7 @@ class Config(object):
         Returns:
             str
         """
-        return str(self._directory)
+        return self._directory
 
     @property
     def fullpath(self):
@@ -106,7 +121,7 @@ class Config(object):
         Returns:
             str
         """
-        return str(os.path.join(self.path, self.directory))
+        return self._fullpath
 
     @property
     def apps_to_ignore(self):
@@ -114,9 +129,9 @@ class Config(object):
         Get the list of applications ignored in the config file.
 
         Returns:
-            set. Set of application names to ignore, lowercase
+            frozenset. Set of application names to ignore, lowercase
         """
-        return set(self._apps_to_ignore)
+        return self._apps_to_ignore
 
     @property
     def apps_to_sync(self):
@@ -124,9 +139,9 @@ class Config(object):
         Get the list of applications allowed in the config file.
 
         Returns:
-            set. Set of application names to allow, lowercase
+            frozenset. Set of application names to allow, lowercase
         """
-        return set(self._apps_to_sync)
+        return self._apps_to_sync
 
     def _setup_parser(self, filename=None):
         """
@@ -138,16 +153,31 @@ class Config(object):
         Returns:
             ConfigParser
         """
-        assert isinstance(filename, str) or filename is None
-
         # If we are not overriding the config filename
         if not filename:
             filename = MACKUP_CONFIG_FILE
 
-        parser = configparser.ConfigParser(
+        full_filename = os.path.join(os.environ["HOME"], filename)
+
+        # Reuse the parser of a previous Config if the file did not change
+        try:
+            st = os.stat(full_filename)
+            # A symlink replacing the file, as restore does, changes the inode
+            # even when the mtime can't tell them apart
+            signature = (st.st_ino, st.st_dev, st.st_mtime_ns, st.st_size)
+        except OSError:
+            signature = None
+        cached = _PARSER_CACHE.get(full_filename)
+        if signature is not None and cached and cached[0] == signature:
+            return cached[1]
+
+        parser = ConfigParser(
             allow_no_value=True, inline_comment_prefixes=(";", "#")
         )
-        parser.read(os.path.join(os.path.join(os.environ["HOME"], filename)))
+        parser.read(full_filename)
+
+        if signature is not None:
+            _PARSER_CACHE[full_filename] = (signature, parser)
 
         return parser
 
@@ -183,8 +213,6 @@ class Config(object):
         else:
             engine = ENGINE_DROPBOX
 
-        assert isinstance(engine, str)
-
         if engine not in [
             ENGINE_DROPBOX,
             ENGINE_GDRIVE,
@@ -244,15 +272,17 @@ class Config(object):
         Parse the applications to ignore in the config.
 
         Returns:
-            set
+            frozenset
         """
         # We ignore nothing by default
-        apps_to_ignore = set()
+        apps_to_ignore = frozenset()
 
         # Is the "[applications_to_ignore]" in the cfg file?
         section_title = "applications_to_ignore"
         if self._parser.has_section(section_title):
-            apps_to_ignore = set(self._parser.options(section_title))
+            apps_to_ignore = frozenset(
+                sys.intern(app) for app in self._parser.options(section_title)
+            )
 
         return apps_to_ignore
 
@@ -261,15 +291,17 @@ class Config(object):
         Parse the applications to backup in the config.
 
         Returns:
-            set
+            frozenset
         """
         # We allow nothing by default
-        apps_to_sync = set()
+        apps_to_sync = frozenset()
 
         # Is the "[applications_to_sync]" section in the cfg file?
         section_title = "applications_to_sync"
         if self._parser.has_section(section_title):
-            apps_to_sync = set(self._parser.options(section_title))
+            apps_to_sync = frozenset(
+                sys.intern(app) for app in self._parser.options(section_title)
+            )
 
         return apps_to_sync
 
@@ -22,6 +22,17 @@ MACKUP_CONFIG_FILE = ".mackup.cfg"
 # Directory that can contains user defined app configs
 CUSTOM_APPS_DIR = ".mackup"
 
+# Default number of threads used to inspect the files of an application.
+# Threads only pay off when stat() is slow, e.g. on a network home folder.
+STAT_THREADS = 1
+
+# Applications with fewer files than this are always inspected serially
+STAT_THREADS_MIN_FILES = 8
+
+# Number of threads used to chmod the folders found in a folder. Like for
+# STAT_THREADS, a pool only pays off on a slow file system.
+CHMOD_THREADS = 1
+
 # Supported engines
 ENGINE_DROPBOX = "dropbox"
 ENGINE_FS = "file_system"
@@ -95,7 +95,7 @@ class Mackup(object):
 
         # If a list of apps to sync is specify, we only allow those
         # Or we allow every supported app by default
-        apps_to_backup = self._config.apps_to_sync or app_db.get_app_names()
+        apps_to_backup = set(self._config.apps_to_sync) or app_db.get_app_names()
 
         # Remove the specified apps to ignore
         for app_name in self._config.apps_to_ignore:
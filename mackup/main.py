@@ -13,12 +13,13 @@ Usage:
   mackup --version
 
 Options:
-  -h --help     Show this screen.
-  -f --force    Force every question asked to be answered with "Yes".
-  -r --root     Allow mackup to be run as superuser.
-  -n --dry-run  Show steps without executing.
-  -v --verbose  Show additional details.
-  --version     Show version.
+  -h --help           Show this screen.
+  -f --force          Force every question asked to be answered with "Yes".
+  -r --root           Allow mackup to be run as superuser.
+  -n --dry-run        Show steps without executing.
+  -v --verbose        Show additional details.
+  --stat-threads=<n>  Number of threads used to inspect files, 1 by default.
+  --version           Show version.
 
 Modes of action:
  1. list: display a list of all supported applications.
@@ -39,7 +40,7 @@ See https://github.com/lra/mackup/tree/master/doc for more information.
 from docopt import docopt
 from .appsdb import ApplicationsDatabase
 from .application import ApplicationProfile
-from .constants import MACKUP_APP_NAME, VERSION
+from .constants import MACKUP_APP_NAME, STAT_THREADS, VERSION
 from .mackup import Mackup
 from . import utils
 import sys
@@ -83,13 +84,21 @@ def main():
 
     verbose = args["--verbose"]
 
+    stat_threads = STAT_THREADS
+    if args["--stat-threads"] is not None:
+        if not args["--stat-threads"].isdigit() or not int(args["--stat-threads"]):
+            utils.error("--stat-threads must be a positive integer")
+        stat_threads = int(args["--stat-threads"])
+
     if args["backup"]:
         # Check the env where the command is being run
         mckp.check_for_usable_backup_env()
 
         # Backup each application
         for app_name in sorted(mckp.get_apps_to_backup()):
-            app = ApplicationProfile(mckp, app_db.get_files(app_name), dry_run, verbose)
+            app = ApplicationProfile(
+                mckp, app_db.get_files(app_name), dry_run, verbose, stat_threads
+            )
             printAppHeader(app_name)
             app.backup()
 
@@ -100,7 +109,7 @@ def main():
         # Restore the Mackup config before any other config, as we might need
         # it to know about custom settings
         mackup_app = ApplicationProfile(
-            mckp, app_db.get_files(MACKUP_APP_NAME), dry_run, verbose
+            mckp, app_db.get_files(MACKUP_APP_NAME), dry_run, verbose, stat_threads
         )
         printAppHeader(MACKUP_APP_NAME)
         mackup_app.restore()
@@ -116,7 +125,9 @@ def main():
         app_names.discard(MACKUP_APP_NAME)
 
         for app_name in sorted(app_names):
-            app = ApplicationProfile(mckp, app_db.get_files(app_name), dry_run, verbose)
+            app = ApplicationProfile(
+                mckp, app_db.get_files(app_name), dry_run, verbose, stat_threads
+            )
             printAppHeader(app_name)
             app.restore()
 
@@ -140,7 +151,7 @@ def main():
 
             for app_name in sorted(app_names):
                 app = ApplicationProfile(
-                    mckp, app_db.get_files(app_name), dry_run, verbose
+                    mckp, app_db.get_files(app_name), dry_run, verbose, stat_threads
                 )
                 printAppHeader(app_name)
                 app.uninstall()
@@ -148,7 +159,7 @@ def main():
             # Restore the Mackup config before any other config, as we might
             # need it to know about custom settings
             mackup_app = ApplicationProfile(
-                mckp, app_db.get_files(MACKUP_APP_NAME), dry_run, verbose
+                mckp, app_db.get_files(MACKUP_APP_NAME), dry_run, verbose, stat_threads
             )
             mackup_app.uninstall()
 
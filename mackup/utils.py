@@ -1,13 +1,13 @@
 """System static utilities being used by the modules."""
 
-import base64
+import errno
+import functools
 import os
 import platform
+import re
 import shutil
 import stat
-import subprocess
 import sys
-import sqlite3
 
 from . import constants
 
@@ -19,6 +19,56 @@ FORCE_YES = False
 # Flag that control if mackup can be run as root
 CAN_RUN_AS_ROOT = False
 
+# How error() displays its message, in red
+_ERROR_FORMAT = "\033[91mError: {}\033[0m"
+
+
+@functools.lru_cache(maxsize=None)
+def _system():
+    """
+    Return the name of the current platform, e.g. PLATFORM_LINUX.
+
+    Returns:
+        str
+    """
+    return platform.system()
+
+
+@functools.lru_cache(maxsize=None)
+def _has_tool(path):
+    """
+    Check if the given command line tool is installed.
+
+    Args:
+        path (str): Absolute path to the tool, e.g. /usr/bin/pgrep
+
+    Returns:
+        bool
+    """
+    return os.path.isfile(path)
+
+
+def _refresh_env():
+    """
+    Read again the environment this module caches.
+
+    Call it after changing $HOME or platform.system(), as the tests do.
+    """
+    global _HOME, _LIBRARY_PATH, _IS_LINUX
+
+    _system.cache_clear()
+    _has_tool.cache_clear()
+
+    _HOME = os.environ["HOME"]
+    # Compute the ~/Library path on macOS
+    # End it with a slash because we are looking for this specific folder and
+    # not any file/folder named LibrarySomething
+    _LIBRARY_PATH = os.path.join(_HOME, "Library/")
+    _IS_LINUX = _system() == constants.PLATFORM_LINUX
+
+
+_refresh_env()
+
 
 def confirm(question):
     """
@@ -62,9 +112,14 @@ def delete(filepath):
     remove_immutable_attribute(filepath)
 
     # Finally remove the files and folders
-    if os.path.isfile(filepath) or os.path.islink(filepath):
+    try:
+        mode = os.lstat(filepath).st_mode
+    except OSError:
+        return
+
+    if stat.S_ISREG(mode) or stat.S_ISLNK(mode):
         os.remove(filepath)
-    elif os.path.isdir(filepath):
+    elif stat.S_ISDIR(mode):
         shutil.rmtree(filepath)
 
 
@@ -86,23 +141,21 @@ def copy(src, dst):
         src (str): Source file or folder
         dst (str): Destination file or folder
     """
-    assert isinstance(src, str)
-    assert os.path.exists(src)
-    assert isinstance(dst, str)
-
     # Create the path to the dst file if it does not exist
     abs_path = os.path.dirname(os.path.abspath(dst))
     if not os.path.isdir(abs_path):
         os.makedirs(abs_path)
 
+    mode = os.stat(src).st_mode
+
     # We need to copy a single file
-    if os.path.isfile(src):
+    if stat.S_ISREG(mode):
         # Copy the src file to dst
-        shutil.copy(src, dst)
+        _copy_file(src, dst)
 
     # We need to copy a whole folder
-    elif os.path.isdir(src):
-        shutil.copytree(src, dst)
+    elif stat.S_ISDIR(mode):
+        _copytree(src, dst)
 
     # What the heck is this?
     else:
@@ -112,6 +165,152 @@ def copy(src, dst):
     chmod(dst)
 
 
+def _copy_file(src, dst):
+    """
+    Copy the content and the mode of the src file to dst.
+
+    Where the OS has copy_file_range(2), the kernel copies the data itself and
+    can even share the blocks on copy-on-write file systems. Otherwise, or if
+    it fails, shutil takes over with its own fast path, e.g. fcopyfile(3) on
+    macOS or sendfile(2) on Linux.
+
+    Args:
+        src (str): Source file
+        dst (str): Destination file
+    """
+    if not _copy_file_range(src, dst):
+        shutil.copyfile(src, dst)
+    shutil.copymode(src, dst)
+
+
+def _copy_file_range(src, dst):
+    """
+    Copy the content of the src file to dst with copy_file_range(2).
+
+    Args:
+        src (str): Source file
+        dst (str): Destination file
+
+    Returns:
+        (bool): True if the whole file was copied, else dst must be copied
+                again some other way
+    """
+    if not hasattr(os, "copy_file_range"):
+        return False
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        # Files like the ones in /proc claim to be empty
+        if not size:
+            return False
+
+        copied = 0
+        try:
+            while True:
+                sent = os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30)
+                if not sent:
+                    break
+                copied += sent
+        except OSError:
+            # e.g. across file systems on old kernels
+            return False
+
+    return copied >= size
+
+
+def _copytree(src, dst):
+    """
+    Copy the src folder and its content to dst, which must not exist.
+
+    Like shutil.copytree(), symlinks are followed and the modification times
+    are kept. Unlike it, extended attributes and file flags are not copied.
+
+    Args:
+        src (str): Source folder
+        dst (str): Destination folder
+    """
+    os.makedirs(dst)
+
+    with os.scandir(src) as entries:
+        for entry in entries:
+            dst_path = os.path.join(dst, entry.name)
+            st = entry.stat()
+
+            if stat.S_ISDIR(st.st_mode):
+                _copytree(entry.path, dst_path)
+            elif stat.S_ISREG(st.st_mode):
+                _copy_file(entry.path, dst_path)
+                os.utime(dst_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+            else:
+                raise ValueError("Unsupported file: {}".format(entry.path))
+
+    st = os.stat(src)
+    os.chmod(dst, stat.S_IMODE(st.st_mode))
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def move(src, dst):
+    """
+    Move a file or a folder (recursively) from src to dst.
+
+    Same rules as copy(). When both are on the same file system, the file or
+    folder is simply renamed, otherwise it is copied to dst then deleted.
+
+    A link is copied then deleted, like copy() would do, so that dst gets the
+    content it points to. So is a folder containing links: renaming it would
+    keep them, and chmod() would then change the files they point to.
+
+    Args:
+        src (str): Source file or folder
+        dst (str): Destination file or folder
+    """
+    mode = os.lstat(src).st_mode
+    if stat.S_ISREG(mode) or (stat.S_ISDIR(mode) and not _contains_links(src)):
+        # Create the path to the dst file if it does not exist
+        abs_path = os.path.dirname(os.path.abspath(dst))
+        if not os.path.isdir(abs_path):
+            os.makedirs(abs_path)
+
+        # Some files have ACLs or immutable attributes, let's remove them
+        # recursively, as delete() would
+        remove_acl(src)
+        remove_immutable_attribute(src)
+
+        try:
+            os.replace(src, dst)
+        except OSError as e:
+            # Not on the same file system
+            if e.errno != errno.EXDEV:
+                raise
+        else:
+            # Set the good mode to the file or folder recursively
+            chmod(dst)
+            return
+
+    copy(src, dst)
+    delete(src)
+
+
+def _contains_links(path):
+    """
+    Check if there is a symlink anywhere in the given folder.
+
+    Args:
+        path (str): Folder to look into, recursively
+
+    Returns:
+        (bool): True if a symlink was found
+    """
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_symlink():
+                return True
+            if entry.is_dir(follow_symlinks=False) and _contains_links(entry.path):
+                return True
+
+    return False
+
+
 def link(target, link_to):
     """
     Create a link to a target file or a folder.
@@ -129,10 +328,6 @@ def link(target, link_to):
         target (str): file or folder the link will point to
         link_to (str): Link to create
     """
-    assert isinstance(target, str)
-    assert os.path.exists(target)
-    assert isinstance(link_to, str)
-
     # Create the path to the link if it does not exist
     abs_path = os.path.dirname(os.path.abspath(link_to))
     if not os.path.isdir(abs_path):
@@ -154,43 +349,111 @@ def chmod(target):
     Args:
         target (str): Root file or folder
     """
-    assert isinstance(target, str)
-    assert os.path.exists(target)
-
     file_mode = stat.S_IRUSR | stat.S_IWUSR
     folder_mode = stat.S_IRUSR | stat.S_IWUSR | stat.S_IXUSR
 
     # Remove the immutable attribute recursively if there is one
     remove_immutable_attribute(target)
 
-    if os.path.isfile(target):
+    mode = os.stat(target).st_mode
+
+    if stat.S_ISREG(mode):
         os.chmod(target, file_mode)
 
-    elif os.path.isdir(target):
+    elif stat.S_ISDIR(mode):
         # chmod the root item
         os.chmod(target, folder_mode)
 
         # chmod recursively in the folder it it's one
-        for root, dirs, files in os.walk(target):
-            for cur_dir in dirs:
-                os.chmod(os.path.join(root, cur_dir), folder_mode)
-            for cur_file in files:
-                os.chmod(os.path.join(root, cur_file), file_mode)
+        if os.scandir in os.supports_fd and os.chmod in os.supports_dir_fd:
+            dir_fd = os.open(target, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                _chmod_tree(
+                    dir_fd, file_mode, folder_mode, threads=constants.CHMOD_THREADS
+                )
+            finally:
+                os.close(dir_fd)
+        else:
+            for root, dirs, files in os.walk(target):
+                for cur_dir in dirs:
+                    os.chmod(os.path.join(root, cur_dir), folder_mode)
+                for cur_file in files:
+                    os.chmod(os.path.join(root, cur_file), file_mode)
 
     else:
         raise ValueError("Unsupported file type: {}".format(target))
 
 
+def _chmod_tree(dir_fd, file_mode, folder_mode, threads=1):
+    """
+    Recursively chmod the content of a folder, given an open fd on it.
+
+    Everything is done relative to the folder's fd, so the kernel doesn't
+    have to resolve the full path of every file again, and scandir() tells us
+    which entries are folders without a stat.
+
+    Args:
+        dir_fd (int): File descriptor of the folder
+        file_mode (int): Mode for the files
+        folder_mode (int): Mode for the folders
+        threads (int): Number of threads used to go through its subfolders
+    """
+    subfolders = []
+
+    with os.scandir(dir_fd) as entries:
+        for entry in entries:
+            # Like os.chmod(), follow links to pick the mode
+            if entry.is_dir():
+                os.chmod(entry.name, folder_mode, dir_fd=dir_fd)
+            else:
+                os.chmod(entry.name, file_mode, dir_fd=dir_fd)
+
+            # But don't recurse into linked folders, like os.walk()
+            if entry.is_dir(follow_symlinks=False):
+                subfolders.append(entry.name)
+
+    chmod_subfolder = functools.partial(
+        _chmod_subfolder, dir_fd, file_mode=file_mode, folder_mode=folder_mode
+    )
+
+    if threads > 1 and len(subfolders) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=min(threads, len(subfolders))) as pool:
+            # Consume the results so that errors are raised here
+            list(pool.map(chmod_subfolder, subfolders))
+    else:
+        for name in subfolders:
+            chmod_subfolder(name)
+
+
+def _chmod_subfolder(dir_fd, name, file_mode, folder_mode):
+    """
+    Recursively chmod the content of a subfolder of the given folder.
+
+    Args:
+        dir_fd (int): File descriptor of the parent folder
+        name (str): Name of the subfolder
+        file_mode (int): Mode for the files
+        folder_mode (int): Mode for the folders
+    """
+    sub_dir_fd = os.open(name, os.O_RDONLY | os.O_DIRECTORY, dir_fd=dir_fd)
+    try:
+        _chmod_tree(sub_dir_fd, file_mode, folder_mode)
+    finally:
+        os.close(sub_dir_fd)
+
+
 def error(message):
     """
     Throw an error with the given message and immediately quit.
 
+    Never returns, SystemExit is raised.
+
     Args:
         message(str): The message to display.
     """
-    fail = "\033[91m"
-    end = "\033[0m"
-    sys.exit(fail + "Error: {}".format(message) + end)
+    sys.exit(_ERROR_FORMAT.format(message))
 
 
 def get_dropbox_folder_location():
@@ -200,13 +463,19 @@ def get_dropbox_folder_location():
     Returns:
         (str) Full path to the current Dropbox folder
     """
+    import base64
+
     host_db_path = os.path.join(os.environ["HOME"], ".dropbox/host.db")
     try:
-        with open(host_db_path, "r") as f_hostdb:
-            data = f_hostdb.read().split()
+        with open(host_db_path, "rb") as f_hostdb:
+            # The path is base64 encoded on the second line
+            f_hostdb.readline()
+            data = f_hostdb.readline().strip()
     except IOError:
+        data = None
+    if not data:
         error(constants.ERROR_UNABLE_TO_FIND_STORAGE.format(provider="Dropbox install"))
-    dropbox_home = base64.b64decode(data[1]).decode()
+    dropbox_home = base64.b64decode(data).decode()
 
     return dropbox_home
 
@@ -222,15 +491,25 @@ def get_google_drive_folder_location():
     yosemite_gdrive_db_path = (
         "Library/Application Support/Google/Drive/" "user_default/sync_config.db"
     )
-    yosemite_gdrive_db = os.path.join(os.environ["HOME"], yosemite_gdrive_db_path)
-    if os.path.isfile(yosemite_gdrive_db):
-        gdrive_db_path = yosemite_gdrive_db
 
     googledrive_home = None
 
-    gdrive_db = os.path.join(os.environ["HOME"], gdrive_db_path)
-    if os.path.isfile(gdrive_db):
-        con = sqlite3.connect(gdrive_db)
+    # Use the first database found, Yosemite's first
+    home = os.environ["HOME"]
+    for db_path in (yosemite_gdrive_db_path, gdrive_db_path):
+        gdrive_db = os.path.join(home, db_path)
+        if os.path.isfile(gdrive_db):
+            break
+    else:
+        gdrive_db = None
+
+    if gdrive_db:
+        # Only the Google Drive engine needs sqlite3, don't load it otherwise
+        import sqlite3
+        from urllib.parse import quote
+
+        # Open the database read only, we just need one value out of it
+        con = sqlite3.connect("file:{}?mode=ro".format(quote(gdrive_db)), uri=True)
         if con:
             cur = con.cursor()
             query = (
@@ -282,8 +561,14 @@ def is_process_running(process_name):
     """
     is_running = False
 
+    # On GNU/Linux, read the process names in /proc rather than running pgrep
+    if _system() == constants.PLATFORM_LINUX and os.path.isdir("/proc"):
+        is_running = _is_process_running_in_proc(process_name)
+
     # On systems with pgrep, check if the given process is running
-    if os.path.isfile("/usr/bin/pgrep"):
+    elif _has_tool("/usr/bin/pgrep"):
+        import subprocess
+
         dev_null = open(os.devnull, "wb")
         returncode = subprocess.call(["/usr/bin/pgrep", process_name], stdout=dev_null)
         is_running = bool(returncode == 0)
@@ -291,6 +576,42 @@ def is_process_running(process_name):
     return is_running
 
 
+def _is_process_running_in_proc(process_name):
+    """
+    Check if a process with the given name is running, using /proc.
+
+    Like pgrep, the name is a regular expression searched in the name of
+    every process.
+
+    Args:
+        (str): Process name, e.g. "Sublime Text"
+
+    Returns:
+        (bool): True if the process is running
+    """
+    try:
+        pattern = re.compile(process_name)
+    except re.error:
+        return False
+
+    with os.scandir("/proc") as entries:
+        for entry in entries:
+            if not entry.name.isdigit():
+                continue
+
+            try:
+                with open(os.path.join(entry.path, "comm")) as f:
+                    name = f.read().rstrip("\n")
+            except OSError:
+                # The process is already gone
+                continue
+
+            if pattern.search(name):
+                return True
+
+    return False
+
+
 def remove_acl(path):
     """
     Remove the ACL of the file or folder located on the given path.
@@ -302,12 +623,12 @@ def remove_acl(path):
         path (str): Path to the file or folder to remove the ACL for,
                     recursively.
     """
+    import subprocess
+
     # Some files have ACLs, let's remove them recursively
-    if platform.system() == constants.PLATFORM_DARWIN and os.path.isfile("/bin/chmod"):
+    if _system() == constants.PLATFORM_DARWIN and _has_tool("/bin/chmod"):
         subprocess.call(["/bin/chmod", "-R", "-N", path])
-    elif (platform.system() == constants.PLATFORM_LINUX) and os.path.isfile(
-        "/bin/setfacl"
-    ):
+    elif _system() == constants.PLATFORM_LINUX and _has_tool("/bin/setfacl"):
         subprocess.call(["/bin/setfacl", "-R", "-b", path])
 
 
@@ -323,14 +644,12 @@ def remove_immutable_attribute(path):
         path (str): Path to the file or folder to remove the immutable
                     attribute for, recursively.
     """
+    import subprocess
+
     # Some files have ACLs, let's remove them recursively
-    if (platform.system() == constants.PLATFORM_DARWIN) and os.path.isfile(
-        "/usr/bin/chflags"
-    ):
+    if _system() == constants.PLATFORM_DARWIN and _has_tool("/usr/bin/chflags"):
         subprocess.call(["/usr/bin/chflags", "-R", "nouchg", path])
-    elif platform.system() == constants.PLATFORM_LINUX and os.path.isfile(
-        "/usr/bin/chattr"
-    ):
+    elif _system() == constants.PLATFORM_LINUX and _has_tool("/usr/bin/chattr"):
         subprocess.call(["/usr/bin/chattr", "-R", "-f", "-i", path])
 
 
@@ -352,18 +671,5 @@ def can_file_be_synced_on_current_platform(path):
     Returns:
         (bool): True if given file can be synced
     """
-    can_be_synced = True
-
     # If the given path is relative, prepend home
-    fullpath = os.path.join(os.environ["HOME"], path)
-
-    # Compute the ~/Library path on macOS
-    # End it with a slash because we are looking for this specific folder and
-    # not any file/folder named LibrarySomething
-    library_path = os.path.join(os.environ["HOME"], "Library/")
-
-    if platform.system() == constants.PLATFORM_LINUX:
-        if fullpath.startswith(library_path):
-            can_be_synced = False
-
-    return can_be_synced
+    return not (_IS_LINUX and os.path.join(_HOME, path).startswith(_LIBRARY_PATH))
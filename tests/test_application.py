@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mackup import utils
+from mackup.application import ApplicationProfile, _probe
+from mackup.mackup import Mackup
+
+
+class TestApplicationProfile(unittest.TestCase):
+    def setUp(self):
+        self.old_environ = os.environ.copy()
+        self.home = tempfile.mkdtemp()
+        os.environ["HOME"] = self.home
+        os.makedirs(os.path.join(self.home, "storage"))
+        with open(os.path.join(self.home, ".mackup.cfg"), "w") as f:
+            f.write("[storage]\nengine = file_system\npath = storage\n")
+
+        self.mckp = Mackup()
+        os.makedirs(self.mckp.mackup_folder)
+        utils.FORCE_YES = True
+
+        # A file, a folder, and files that don't exist
+        self.write(os.path.join(self.home, ".file"), "file")
+        self.write(os.path.join(self.home, ".folder", "file"), "folder")
+        self.files = {".file", ".folder", ".missing", "Library/missing"}
+
+    def tearDown(self):
+        utils.FORCE_YES = False
+        self.mckp.clean_temp_folder()
+        shutil.rmtree(self.home)
+        os.environ.clear()
+        os.environ.update(self.old_environ)
+
+    def write(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def app(self, dry_run=False):
+        return ApplicationProfile(self.mckp, set(self.files), dry_run, True)
+
+    def test_backup(self):
+        self.app().backup()
+
+        for filename in (".file", ".folder"):
+            home_filepath = os.path.join(self.home, filename)
+            mackup_filepath = os.path.join(self.mckp.mackup_folder, filename)
+            assert os.path.islink(home_filepath)
+            assert os.path.samefile(home_filepath, mackup_filepath)
+        assert self.read(os.path.join(self.home, ".folder", "file")) == "folder"
+        assert not os.path.lexists(os.path.join(self.home, ".missing"))
+
+        # Backing up again does nothing
+        self.app().backup()
+        assert self.read(os.path.join(self.home, ".file")) == "file"
+
+    def test_backup_in_parallel(self):
+        self.files = {".file{}".format(i) for i in range(10)}
+        for filename in self.files:
+            self.write(os.path.join(self.home, filename), filename)
+
+        ApplicationProfile(self.mckp, set(self.files), False, False, 4).backup()
+
+        for filename in self.files:
+            home_filepath = os.path.join(self.home, filename)
+            assert os.path.islink(home_filepath)
+            assert self.read(home_filepath) == filename
+
+    def test_restore(self):
+        self.app().backup()
+        os.remove(os.path.join(self.home, ".file"))
+        shutil.rmtree(os.path.join(self.mckp.mackup_folder, ".folder"))
+
+        self.app().restore()
+
+        assert os.path.islink(os.path.join(self.home, ".file"))
+        assert self.read(os.path.join(self.home, ".file")) == "file"
+        # Nothing to restore, the broken link is left alone
+        assert os.path.islink(os.path.join(self.home, ".folder"))
+        assert not os.path.exists(os.path.join(self.home, ".folder"))
+
+    def test_uninstall(self):
+        self.app().backup()
+        self.app().uninstall()
+
+        assert not os.path.islink(os.path.join(self.home, ".file"))
+        assert self.read(os.path.join(self.home, ".file")) == "file"
+        assert not os.path.islink(os.path.join(self.home, ".folder"))
+        assert self.read(os.path.join(self.home, ".folder", "file")) == "folder"
+
+    def test_dry_run(self):
+        self.app(dry_run=True).backup()
+
+        assert not os.path.islink(os.path.join(self.home, ".file"))
+        assert os.listdir(self.mckp.mackup_folder) == []
+
+    def test_probe(self):
+        probe = _probe(os.path.join(self.home, ".file"))
+        assert (probe.exists, probe.is_file, probe.is_symlink) == (True, True, False)
+        assert _probe(os.path.join(self.home, ".folder")).is_dir
+
+        link = os.path.join(self.home, ".link")
+        os.symlink(os.path.join(self.home, ".folder"), link)
+        probe = _probe(link)
+        assert (probe.is_dir, probe.is_symlink) == (True, True)
+        assert probe.st_ino == os.stat(os.path.join(self.home, ".folder")).st_ino
+
+        os.remove(link)
+        os.symlink(os.path.join(self.home, ".missing"), link)
+        probe = _probe(link)
+        assert (probe.exists, probe.is_symlink) == (False, True)
+
+        assert not _probe(os.path.join(self.home, ".missing")).exists
+        assert not _probe(os.path.join(self.home, ".file", "below")).exists
+        assert not _probe("bad\0path").exists
+
+    def test_files_order(self):
+        app = ApplicationProfile(self.mckp, {"b/c", "ab", "b", "a"}, False, False)
+
+        assert app.files == ("a", "b", "ab", "b/c")
@@ -0,0 +1,102 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from mackup.appsdb import ApplicationsDatabase
+
+
+class TestApplicationsDatabase(unittest.TestCase):
+    def setUp(self):
+        self.old_environ = os.environ.copy()
+        self.home = tempfile.mkdtemp()
+        os.environ["HOME"] = self.home
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.home, "cache")
+        os.environ.pop("XDG_CONFIG_HOME", None)
+
+        # Run as a regular user, the cache isn't written for root
+        self.geteuid = patch("mackup.appsdb.os.geteuid", return_value=1000)
+        self.geteuid.start()
+
+    def tearDown(self):
+        self.geteuid.stop()
+        os.environ.clear()
+        os.environ.update(self.old_environ)
+        shutil.rmtree(self.home)
+
+    def write_custom_app(self, content):
+        custom_apps_dir = os.path.join(self.home, ".mackup")
+        os.makedirs(custom_apps_dir, exist_ok=True)
+        with open(os.path.join(custom_apps_dir, "my-app.cfg"), "w") as f:
+            f.write(content)
+
+    def test_cache_is_used(self):
+        app_db = ApplicationsDatabase()
+        assert "bash" in app_db.get_app_names()
+
+        # The cache is plain data
+        with open(ApplicationsDatabase.get_cache_file()) as f:
+            cache = json.load(f)
+        assert cache["apps"]["bash"]["name"] == app_db.get_name("bash")
+
+        # Parsing again would fail, so the cache must be used
+        def fail(config_files):
+            raise AssertionError("Config files parsed again")
+
+        parse_config_files = ApplicationsDatabase.parse_config_files
+        ApplicationsDatabase.parse_config_files = staticmethod(fail)
+        try:
+            assert ApplicationsDatabase().apps == app_db.apps
+        finally:
+            ApplicationsDatabase.parse_config_files = parse_config_files
+
+    def test_cache_is_invalidated(self):
+        self.write_custom_app("[application]\nname = My App\n")
+        assert ApplicationsDatabase().get_name("my-app") == "My App"
+
+        # Same size, different content and mtime
+        self.write_custom_app("[application]\nname = My Bpp\n")
+        config_file = os.path.join(self.home, ".mackup", "my-app.cfg")
+        st = os.stat(config_file)
+        os.utime(config_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+        assert ApplicationsDatabase().get_name("my-app") == "My Bpp"
+
+        # A different XDG config home changes the files to sync
+        self.write_custom_app(
+            "[application]\nname = My App\n[xdg_configuration_files]\napp\n"
+        )
+        assert ApplicationsDatabase().get_files("my-app") == {".config/app"}
+        os.environ["XDG_CONFIG_HOME"] = os.path.join(self.home, "xdg")
+        assert ApplicationsDatabase().get_files("my-app") == {"xdg/app"}
+
+    def test_cache_file_location(self):
+        default = os.path.join(self.home, ".cache", "mackup", "appsdb.json")
+
+        # Empty and relative paths are ignored, as per the XDG spec
+        for xdg_cache_home in ("", "relative/cache"):
+            os.environ["XDG_CACHE_HOME"] = xdg_cache_home
+            assert ApplicationsDatabase.get_cache_file() == default
+
+        del os.environ["XDG_CACHE_HOME"]
+        assert ApplicationsDatabase.get_cache_file() == default
+
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.home, "cache")
+        assert ApplicationsDatabase.get_cache_file() == os.path.join(
+            self.home, "cache", "mackup", "appsdb.json"
+        )
+
+    def test_cache_not_written_as_root(self):
+        with patch("mackup.appsdb.os.geteuid", return_value=0):
+            assert "bash" in ApplicationsDatabase().get_app_names()
+
+        assert not os.path.exists(os.path.join(self.home, "cache"))
+
+    def test_corrupted_cache(self):
+        cache_file = ApplicationsDatabase.get_cache_file()
+        os.makedirs(os.path.dirname(cache_file))
+        with open(cache_file, "wb") as f:
+            f.write(b"garbage")
+
+        assert "bash" in ApplicationsDatabase().get_app_names()
@@ -1,5 +1,7 @@
 import unittest
 import os.path
+import shutil
+import tempfile
 
 from mackup.constants import (
     ENGINE_DROPBOX,
@@ -211,5 +213,33 @@ class TestConfig(unittest.TestCase):
         assert cfg.apps_to_ignore == set(["subversion", "sequel-pro", "sabnzbd"])
         assert cfg.apps_to_sync == set(["sabnzbd", "sublime-text-3", "x11", "vim"])
 
+    def test_config_reloaded_when_changed(self):
+        temp_home = tempfile.mkdtemp()
+        os.environ["HOME"] = temp_home
+        config_file = os.path.join(temp_home, "mackup-changed.cfg")
+
+        with open(config_file, "w") as f:
+            f.write("[storage]\nengine = file_system\npath = some/path\n")
+        assert Config("mackup-changed.cfg").path == os.path.join(temp_home, "some/path")
+
+        # Same size, but another mtime
+        with open(config_file, "w") as f:
+            f.write("[storage]\nengine = file_system\npath = some/othr\n")
+        st = os.stat(config_file)
+        os.utime(config_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+        assert Config("mackup-changed.cfg").path == os.path.join(temp_home, "some/othr")
+
+        # Same size and mtime, but replaced by a link to another file
+        other_file = os.path.join(temp_home, "mackup-other.cfg")
+        with open(other_file, "w") as f:
+            f.write("[storage]\nengine = file_system\npath = some/more\n")
+        st = os.stat(config_file)
+        os.utime(other_file, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.remove(config_file)
+        os.symlink(other_file, config_file)
+        assert Config("mackup-changed.cfg").path == os.path.join(temp_home, "some/more")
+
+        shutil.rmtree(temp_home)
+
     def test_config_old_config(self):
         self.assertRaises(SystemExit, Config, "mackup-old-config.cfg")
@@ -1,9 +1,11 @@
+import errno
 import os
+import re
 import tempfile
 import unittest
 import stat
 
-# from unittest.mock import patch
+from unittest.mock import patch
 
 from mackup import utils
 
@@ -209,6 +211,136 @@ class TestMackup(unittest.TestCase):
         utils.delete(srcpath)
         utils.delete(dstpath)
 
+    def test_copy_dir_content(self):
+        """Copies the content of nested files and folders."""
+        srcpath = tempfile.mkdtemp()
+        os.makedirs(os.path.join(srcpath, "sub", "subsub"))
+        content = os.urandom(300 * 1024)
+        with open(os.path.join(srcpath, "sub", "subsub", "big"), "wb") as f:
+            f.write(content)
+        with open(os.path.join(srcpath, "small"), "w") as f:
+            f.write("small")
+        os.utime(os.path.join(srcpath, "small"), (1000000000, 1000000000))
+        os.symlink("small", os.path.join(srcpath, "link"))
+
+        dstpath = os.path.join(tempfile.mkdtemp(), "copy")
+        utils.copy(srcpath, dstpath)
+
+        with open(os.path.join(dstpath, "sub", "subsub", "big"), "rb") as f:
+            assert f.read() == content
+        with open(os.path.join(dstpath, "small")) as f:
+            assert f.read() == "small"
+        assert os.path.getmtime(os.path.join(dstpath, "small")) == 1000000000
+        # Symlinks are followed
+        assert not os.path.islink(os.path.join(dstpath, "link"))
+        with open(os.path.join(dstpath, "link")) as f:
+            assert f.read() == "small"
+
+        utils.delete(srcpath)
+        utils.delete(os.path.dirname(dstpath))
+
+    def test_move_file(self):
+        # Create a tmp file
+        tfile = tempfile.NamedTemporaryFile(delete=False)
+        srcfile = tfile.name
+        tfile.close()
+        os.chmod(srcfile, stat.S_IREAD)
+
+        # Create a tmp folder
+        dstpath = tempfile.mkdtemp()
+        # Set the destination filename
+        dstfile = os.path.join(dstpath, "subfolder", os.path.basename(srcfile))
+
+        # Check if mackup can move it, and set the good mode
+        utils.move(srcfile, dstfile)
+        assert not os.path.exists(srcfile)
+        assert os.path.isfile(dstfile)
+        assert convert_to_octal(dstfile) == "600"
+
+        # Let's clean up
+        utils.delete(dstpath)
+
+    def test_move_dir_across_file_systems(self):
+        # Create a tmp folder with a file in it
+        srcpath = tempfile.mkdtemp()
+        tfile = tempfile.NamedTemporaryFile(delete=False, dir=srcpath)
+        srcfile = tfile.name
+        tfile.close()
+
+        # Create a tmp folder
+        dstpath = tempfile.mkdtemp()
+        # Set the destination folder name
+        dstfolder = os.path.join(dstpath, os.path.basename(srcpath))
+
+        # Pretend the destination is on another file system
+        def replace(src, dst):
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+        with patch("mackup.utils.os.replace", replace):
+            utils.move(srcpath, dstfolder)
+
+        assert not os.path.exists(srcpath)
+        assert os.path.isdir(dstfolder)
+        assert os.path.isfile(os.path.join(dstfolder, os.path.basename(srcfile)))
+
+        # Let's clean up
+        utils.delete(dstpath)
+
+    def test_move_link(self):
+        # Create a tmp file and a link to it
+        tfile = tempfile.NamedTemporaryFile(delete=False)
+        srcfile = tfile.name
+        tfile.close()
+        srcpath = tempfile.mkdtemp()
+        srclink = os.path.join(srcpath, "link")
+        os.symlink(srcfile, srclink)
+
+        # Create a tmp folder
+        dstpath = tempfile.mkdtemp()
+        dstfile = os.path.join(dstpath, "file")
+
+        # The link is replaced by a copy of what it points to
+        utils.move(srclink, dstfile)
+        assert not os.path.lexists(srclink)
+        assert os.path.isfile(srcfile)
+        assert os.path.isfile(dstfile)
+        assert not os.path.islink(dstfile)
+
+        # Let's clean up
+        utils.delete(srcfile)
+        utils.delete(srcpath)
+        utils.delete(dstpath)
+
+    def test_move_dir_with_link_outside(self):
+        # Create a tmp folder with a link to a file outside of it
+        outside_path = tempfile.mkdtemp()
+        outside_file = os.path.join(outside_path, "file")
+        with open(outside_file, "w") as f:
+            f.write("outside")
+        os.chmod(outside_file, 0o644)
+        srcpath = tempfile.mkdtemp()
+        os.makedirs(os.path.join(srcpath, "sub"))
+        os.symlink(outside_file, os.path.join(srcpath, "sub", "link"))
+
+        # Create a tmp folder
+        dstpath = tempfile.mkdtemp()
+        dstfolder = os.path.join(dstpath, "folder")
+
+        # The folder is copied, not renamed with the link in it
+        utils.move(srcpath, dstfolder)
+        assert not os.path.exists(srcpath)
+        dstlink = os.path.join(dstfolder, "sub", "link")
+        assert not os.path.islink(dstlink)
+        with open(dstlink) as f:
+            assert f.read() == "outside"
+
+        # What the link pointed to is left alone
+        assert convert_to_octal(outside_file) == "644"
+
+        # Let's clean up
+        utils.delete(outside_path)
+        utils.delete(dstpath)
+
     def test_link_file(self):
         # Create a tmp file
         tfile = tempfile.NamedTemporaryFile(delete=False)
@@ -272,6 +404,41 @@ class TestMackup(unittest.TestCase):
         # Use an "unsupported file type". In this case, /dev/null
         self.assertRaises(ValueError, utils.chmod, os.devnull)
 
+    def test_chmod_folder_recursively(self):
+        # Create a tmp folder with files and folders in it
+        dir_name = tempfile.mkdtemp()
+        nested_dir = os.path.join(dir_name, "a", "b")
+        os.makedirs(nested_dir)
+        nested_file = os.path.join(nested_dir, "file")
+        open(nested_file, "w").close()
+        os.symlink(nested_dir, os.path.join(dir_name, "link"))
+        other_dir = os.path.join(dir_name, "c")
+        os.makedirs(other_dir)
+        other_file = os.path.join(other_dir, "file")
+        open(other_file, "w").close()
+
+        os.chmod(nested_file, stat.S_IREAD)
+        os.chmod(nested_dir, stat.S_IREAD | stat.S_IEXEC)
+        os.chmod(other_file, stat.S_IREAD)
+
+        utils.chmod(dir_name)
+        assert convert_to_octal(os.path.join(dir_name, "a")) == "700"
+        assert convert_to_octal(nested_dir) == "700"
+        assert convert_to_octal(nested_file) == "600"
+        assert convert_to_octal(other_dir) == "700"
+        assert convert_to_octal(other_file) == "600"
+
+        # Same thing with a thread pool
+        os.chmod(nested_file, stat.S_IREAD)
+        os.chmod(other_file, stat.S_IREAD)
+        with patch("mackup.constants.CHMOD_THREADS", 4):
+            utils.chmod(dir_name)
+        assert convert_to_octal(nested_file) == "600"
+        assert convert_to_octal(other_file) == "600"
+
+        # Let's clean up
+        utils.delete(dir_name)
+
     def test_error(self):
         test_string = "Hello World"
         self.assertRaises(SystemExit, utils.error, test_string)
@@ -302,16 +469,26 @@ class TestMackup(unittest.TestCase):
         assert utils.is_process_running("a*")
         assert not utils.is_process_running("some imaginary process")
 
+    @unittest.skipUnless(os.path.isdir("/proc/self"), "requires /proc")
+    def test_is_process_running_in_proc(self):
+        with open("/proc/self/comm") as f:
+            name = f.read().rstrip("\n")
+
+        assert utils._is_process_running_in_proc("^{}$".format(re.escape(name)))
+        assert not utils._is_process_running_in_proc("some imaginary process")
+
     def test_can_file_be_synced_on_current_platform(self):
         # Any file path will do, even if it doesn't exist
         path = "some/file"
 
         # Force the Mac OSX Test using lambda magic
         utils.platform.system = lambda *args: utils.constants.PLATFORM_DARWIN
+        utils._refresh_env()
         assert utils.can_file_be_synced_on_current_platform(path)
 
         # Force the Linux Test using lambda magic
         utils.platform.system = lambda *args: utils.constants.PLATFORM_LINUX
+        utils._refresh_env()
         assert utils.can_file_be_synced_on_current_platform(path)
 
         # Try to use the library path on Linux, which shouldn't work